@@ -0,0 +1,295 @@
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from rpc import PrimeClient, server_address
+from policies import make_policy
+from workloads import make_workload
+
+SAMPLE_COLUMNS = ["Trial", "Seq", "Number", "Server", "IsPrime", "StartTime", "ResponseTime", "NetworkTime", "QueueTime", "ComputeTime"]
+
+DEFAULT_SCENARIO = {
+    "trials": 1,
+    "count": None,  # 1トライアルのリクエスト数. None なら duration まで (または Ctrl-C まで) 送り続ける
+    "concurrency": 100,  # 同時に処理するリクエスト数 (クライアントのスレッド数)
+    "max_inflight": None,  # 送信済みで未完了のリクエストの上限. None なら concurrency と同じ
+    "policy": {"type": "round_robin"},
+    "transport": "unary",
+    "broadcast": False,  # True なら全ての数を全サーバに送る (実験2)
+    "warmup": 0,  # 計測前に送って捨てるリクエスト数
+    "duration": None,  # 秒. 指定するとトライアルごとにこの時間で打ち切る
+}
+
+
+def load_scenario(path):
+    """シナリオファイル(JSON)を読み込み, 省略された項目を既定値で埋める"""
+    with open(path) as f:
+        scenario = {**DEFAULT_SCENARIO, **json.load(f)}
+    if "workload" not in scenario:
+        raise ValueError(f"scenario '{path}' is missing 'workload'")
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return scenario
+
+
+class LatencyRecorder:
+    """応答時間を対数バケットで数える
+
+    サンプルを保持しないので, リクエスト数が増えてもメモリ使用量は一定.
+    分位点の誤差はバケット幅 (1%) 以内.
+    """
+
+    MIN_LATENCY = 1e-6
+    GROWTH = 1.01
+    _SCALE = 1 / math.log(GROWTH)
+    BREAKDOWN = ("NetworkTime", "QueueTime", "ComputeTime")
+
+    def __init__(self):
+        self.buckets = {}
+        self.requests = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = None
+        self.breakdown_total = [0.0, 0.0, 0.0]
+        self.breakdown_count = [0, 0, 0]
+
+    def record(self, sample):
+        self.requests += 1
+        if sample["IsPrime"] not in ('T', 'F'):
+            self.errors += 1
+            return
+        latency = sample["ResponseTime"]
+        index = int(math.log(max(latency, self.MIN_LATENCY) / self.MIN_LATENCY) * self._SCALE)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        self.total += latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+        # 1リクエストごとに呼ばれるのでループを使わずに足す
+        network, queue, compute = sample["NetworkTime"], sample["QueueTime"], sample["ComputeTime"]
+        if network is not None:
+            self.breakdown_total[0] += network
+            self.breakdown_count[0] += 1
+        if queue is not None:
+            self.breakdown_total[1] += queue
+            self.breakdown_count[1] += 1
+        if compute is not None:
+            self.breakdown_total[2] += compute
+            self.breakdown_count[2] += 1
+
+    def percentile(self, q):
+        ok = self.requests - self.errors
+        if not ok:
+            return None
+        rank = min(int(q * ok), ok - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(self.MIN_LATENCY * self.GROWTH ** (index + 1), self.max)
+        return self.max
+
+    def stats(self):
+        ok = self.requests - self.errors
+        stats = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "mean": self.total / ok if ok else None,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+        for column, total, count in zip(self.BREAKDOWN, self.breakdown_total, self.breakdown_count):
+            stats[column] = total / count if count else None
+        return stats
+
+
+class Results:
+    """完了したリクエストを集計し, sink (あれば) に1件ずつ渡す"""
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.overall = LatencyRecorder()
+        self.per_server = {}
+        self.elapsed = 0.0
+        self.interrupted = False
+
+    def record(self, sample):
+        sample["Seq"] = self.overall.requests
+        self.overall.record(sample)
+        recorder = self.per_server.get(sample["Server"])
+        if recorder is None:
+            recorder = self.per_server[sample["Server"]] = LatencyRecorder()
+        recorder.record(sample)
+        if self.sink is not None:
+            self.sink(sample)
+
+    def summary(self):
+        """計測結果全体とサーバごとの統計をまとめる"""
+        summary = self.overall.stats()
+        summary["elapsed"] = self.elapsed
+        ok = summary["requests"] - summary["errors"]
+        summary["throughput"] = ok / self.elapsed if self.elapsed > 0 else None
+        summary["per_server"] = {server: self.per_server[server].stats() for server in sorted(self.per_server)}
+        return summary
+
+
+def send_request(client, policy, number, trial, run_start, target=None, deadline=None):
+    """1件送信して結果の辞書を返す. deadline を過ぎていたら送らずに None を返す"""
+    start = time.perf_counter()
+    if deadline is not None and start > deadline:
+        return None  # 時間切れ
+    # 振り分け先はワーカーが実際に送信するときに選ぶ (処理中の数を見る方針のため)
+    server = target or policy.choose()
+    policy.on_start(server)
+    is_prime, response_time, network_time, queue_time, compute_time = client.check_prime(server, number)
+    policy.on_finish(server, response_time)
+    return {
+        "Trial": trial,
+        "Number": number,
+        "Server": server,
+        "IsPrime": 'T' if is_prime == True else 'F' if is_prime == False else 'Error',
+        "StartTime": start - run_start,
+        "ResponseTime": response_time,
+        "NetworkTime": network_time,
+        "QueueTime": queue_time,
+        "ComputeTime": compute_time,
+    }
+
+
+def run_trial(client, policy, numbers, scenario, trial, results):
+    """1トライアル分の数を送信して経過時間を返す
+
+    数はイテレータから必要な分だけ取り出し, 未完了のリクエストが max_inflight 個に
+    達したら, どれかが完了するまで次を送らない. Ctrl-C で送信をやめ, 送信済みの分を待つ.
+    """
+    deadline = time.perf_counter() + scenario["duration"] if scenario["duration"] else None
+    max_inflight = scenario["max_inflight"] or scenario["concurrency"]
+    targets = policy.servers if scenario["broadcast"] else [None]
+    jobs = ((target, number) for number in numbers for target in targets)
+    trial_results = LatencyRecorder()
+    run_start = time.perf_counter()
+
+    def collect(done):
+        for future in done:
+            sample = future.result()
+            if sample is not None:
+                trial_results.record(sample)
+                results.record(sample)
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=scenario["concurrency"]) as executor:
+        try:
+            for target, number in jobs:
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                if len(pending) >= max_inflight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(send_request, client, policy, number, trial, run_start, target, deadline))
+        except KeyboardInterrupt:
+            print("Interrupted; waiting for in-flight requests")
+            results.interrupted = True
+        done, _ = wait(pending)
+        collect(done)
+    elapsed = time.perf_counter() - run_start
+
+    stats = trial_results.stats()
+    if trial:
+        print(f"Trial {trial}: {stats['requests']} requests in {elapsed:.2f}s, "
+              f"mean {stats['mean'] or 0:.4f}s, p99 {stats['p99'] or 0:.4f}s, errors {stats['errors']}")
+    return elapsed
+
+
+def run_scenario(scenario, servers, sink=None):
+    """シナリオを実行して集計結果を返す. 各リクエストの結果は sink に渡す"""
+    if scenario["count"] is None and scenario["duration"] is None:
+        print("Neither count nor duration is set; running until Ctrl-C")
+    client = PrimeClient(scenario["transport"])
+    policy = make_policy(scenario["policy"], servers)
+    results = Results(sink)
+    try:
+        if scenario["warmup"]:
+            warmup = make_workload(scenario["workload"], scenario["warmup"])
+            run_trial(client, policy, warmup, {**scenario, "duration": None}, 0, Results())
+
+        for trial in range(1, scenario["trials"] + 1):
+            numbers = make_workload(scenario["workload"], scenario["count"])
+            results.elapsed += run_trial(client, policy, numbers, scenario, trial, results)
+            if results.interrupted:
+                break
+    finally:
+        client.close()
+    return results.summary()
+
+
+def run_and_write(prefix, scenario, servers, runner=run_scenario):
+    """runner(scenario, servers, sink) を実行し, 全サンプルを <prefix>.csv に逐次書き込み, 集計結果を <prefix>.json に書き込む"""
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(prefix + ".csv", "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SAMPLE_COLUMNS)
+        writer.writeheader()
+        summary = runner(scenario, servers, writer.writerow)
+    with open(prefix + ".json", "w") as f:
+        json.dump({"scenario": scenario, "servers": servers, "started_at": started_at, "summary": summary}, f, indent=2)
+    return summary
+
+
+def format_value(value):
+    return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+
+def compare(paths):
+    """複数の結果ファイル(JSON)の主要な指標を並べて表示する"""
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f)["summary"])
+    keys = ["requests", "errors", "throughput", "mean", "p50", "p90", "p99", "max", "NetworkTime", "QueueTime", "ComputeTime"]
+    width = max(len(os.path.basename(path)) for path in paths) + 2
+    print(f"{'':<14}" + "".join(f"{os.path.basename(path):>{width}}" for path in paths))
+    for key in keys:
+        print(f"{key:<14}" + "".join(f"{format_value(result.get(key)):>{width}}" for result in results))
+    base = results[0].get("throughput")
+    if base:
+        print(f"{'throughput %':<14}" + "".join(f"{(result['throughput'] or 0) / base * 100:>{width}.1f}" for result in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scenario-driven benchmark for the gRPC prime servers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a scenario file.")
+    run_parser.add_argument('scenario', type=str, help="Path to the scenario JSON file.")
+    run_parser.add_argument('--servers', type=str, help="Comma-separated list of server addresses (host or host:port). Overrides the scenario.")
+    run_parser.add_argument('--out', type=str, help="Output path prefix (default: results/<name>_<timestamp>).")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare result JSON files.")
+    compare_parser.add_argument('results', nargs='+', help="Result JSON files written by 'run'.")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.results)
+        return
+
+    scenario = load_scenario(args.scenario)
+    servers = args.servers.split(',') if args.servers else scenario.get("servers")
+    if not servers:
+        parser.error("no servers given (use --servers or set 'servers' in the scenario)")
+    servers = [server_address(server) for server in servers]
+
+    prefix = args.out or os.path.join("results", f"{scenario['name']}_{time.strftime('%Y%m%d-%H%M%S')}")
+    summary = run_and_write(prefix, scenario, servers)
+    print(f"Throughput: {summary['throughput'] or 0:.1f} req/s, mean {summary['mean'] or 0:.4f}s, "
+          f"p99 {summary['p99'] or 0:.4f}s, errors {summary['errors']}")
+    print(f"Results written to {prefix}.json and {prefix}.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import threading
+from random import Random
+
+
+class Policy:
+    """クライアント側ロードバランサの振り分け方針
+
+    choose() で送信先を選び, 送信時に on_start(), 応答時に on_finish() を呼ぶ.
+    時刻は参照しないので, 実機のベンチマークとシミュレータの両方で同じコードを使える.
+    複数スレッドから呼ばれるため, 状態の更新はロックで保護する.
+    """
+
+    def __init__(self, servers):
+        if not servers:
+            raise ValueError("at least one server is required")
+        self.servers = list(servers)
+        self._lock = threading.Lock()
+        self.inflight = {server: 0 for server in self.servers}
+
+    def choose(self):
+        raise NotImplementedError
+
+    def on_start(self, server):
+        with self._lock:
+            self.inflight[server] += 1
+
+    def on_finish(self, server, latency):
+        with self._lock:
+            self.inflight[server] -= 1
+
+
+class RoundRobin(Policy):
+    """サーバを順番に使う (これまでの test1.py/test3.py と同じ)"""
+
+    def __init__(self, servers):
+        super().__init__(servers)
+        self._next = 0
+
+    def choose(self):
+        with self._lock:
+            server = self.servers[self._next]
+            self._next = (self._next + 1) % len(self.servers)
+        return server
+
+
+class WeightedRoundRobin(Policy):
+    """重みに比例した回数だけ使う (nginxと同じ smooth weighted round robin)"""
+
+    def __init__(self, servers, weights=None):
+        super().__init__(servers)
+        weights = weights or {}
+        self.weights = {server: float(weights.get(server, 1)) for server in self.servers}
+        self._current = {server: 0.0 for server in self.servers}
+        self._total = sum(self.weights.values())
+
+    def choose(self):
+        with self._lock:
+            for server in self.servers:
+                self._current[server] += self.weights[server]
+            server = max(self.servers, key=self._current.get)
+            self._current[server] -= self._total
+        return server
+
+
+class RandomChoice(Policy):
+    """一様ランダムに選ぶ"""
+
+    def __init__(self, servers, seed=None):
+        super().__init__(servers)
+        self._random = Random(seed)
+
+    def choose(self):
+        with self._lock:
+            return self._random.choice(self.servers)
+
+
+class LeastInflight(Policy):
+    """処理中のリクエストが最も少ないサーバを選ぶ (同数ならリストの順)"""
+
+    def choose(self):
+        with self._lock:
+            return min(self.servers, key=self.inflight.get)
+
+
+class PowerOfTwoChoices(Policy):
+    """ランダムに2台選び, 処理中のリクエストが少ない方を使う"""
+
+    def __init__(self, servers, seed=None):
+        super().__init__(servers)
+        self._random = Random(seed)
+
+    def choose(self):
+        with self._lock:
+            if len(self.servers) == 1:
+                return self.servers[0]
+            a, b = self._random.sample(self.servers, 2)
+            return a if self.inflight[a] <= self.inflight[b] else b
+
+
+class LeastLatency(Policy):
+    """応答時間の指数移動平均 × (処理中+1) が最小のサーバを選ぶ"""
+
+    def __init__(self, servers, alpha=0.2):
+        super().__init__(servers)
+        self.alpha = alpha
+        self.ewma = {server: 0.0 for server in self.servers}
+
+    def choose(self):
+        with self._lock:
+            return min(self.servers, key=lambda server: self.ewma[server] * (self.inflight[server] + 1))
+
+    def on_finish(self, server, latency):
+        with self._lock:
+            self.inflight[server] -= 1
+            if self.ewma[server] == 0.0:
+                self.ewma[server] = latency
+            else:
+                self.ewma[server] += self.alpha * (latency - self.ewma[server])
+
+
+POLICIES = {
+    "round_robin": RoundRobin,
+    "weighted_round_robin": WeightedRoundRobin,
+    "random": RandomChoice,
+    "least_inflight": LeastInflight,
+    "power_of_two": PowerOfTwoChoices,
+    "least_latency": LeastLatency,
+}
+
+
+def make_policy(spec, servers):
+    """シナリオの "policy" ({"type": ..., その他の引数}) から Policy を作る"""
+    spec = dict(spec or {"type": "round_robin"})
+    name = spec.pop("type", "round_robin")
+    if name not in POLICIES:
+        raise ValueError(f"unknown policy '{name}' (choose from {', '.join(POLICIES)})")
+    return POLICIES[name](servers, **spec)
@@ -0,0 +1,131 @@
+import argparse
+import heapq
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain, islice
+from bench import Results, run_and_write, send_request
+from policies import make_policy
+from rpc import TRANSPORTS, PrimeClient, server_address
+from workloads import tracefile  # server-py/tracefile.py (workloads が読み込み先を設定する)
+
+
+def load_trace(paths, limit=None):
+    """トレースファイル (複数可) の記録を到着時刻順に (時刻, 値, 送信元) で1件ずつ返す
+
+    ファイルごとに到着順に並べ直しながら読み, heapq.merge でまとめる. 全件を読み込まないので
+    長いトレースでもメモリは増えない.
+    """
+    streams = [((record.time, record.value, record.source) for record in tracefile.read_trace_by_arrival(path))
+               for path in paths]
+    return islice(heapq.merge(*streams), limit)
+
+
+def replay(scenario, servers, sink=None):
+    """トレースを元の到着間隔 (を speed 倍に縮めた間隔) で送り直して集計結果を返す
+
+    送信は開ループで, 応答を待たずに予定時刻に送る. 未完了が max_inflight 個に
+    達すると予定より遅れて送ることになり, その遅れ (lag) も集計する.
+    """
+    records = load_trace(scenario["traces"], scenario["limit"])
+    first = next(records, None)
+    if first is None:
+        raise ValueError("the trace contains no requests")
+    first_time = last_time = first[0]
+    sources = set()
+    print(f"Replaying {', '.join(scenario['traces'])} at {scenario['speed']}x")
+
+    client = PrimeClient(scenario["transport"])
+    policy = make_policy(scenario["policy"], servers)
+    results = Results(sink)
+    max_inflight = scenario["max_inflight"]
+    lag_total = 0.0
+    lag_max = 0.0
+    late = 0
+    out_of_order = 0
+
+    def collect(done):
+        for future in done:
+            results.record(future.result())
+
+    pending = set()
+    run_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+            try:
+                for arrival, value, source in chain([first], records):
+                    if arrival < last_time:
+                        out_of_order += 1  # 並べ直しに失敗した記録 (本来は起きない)
+                    last_time = max(last_time, arrival)
+                    sources.add(source)
+                    due = run_start + (arrival - first_time) / scenario["speed"]
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    if len(pending) >= max_inflight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    lag = max(time.perf_counter() - due, 0.0)
+                    lag_total += lag
+                    lag_max = max(lag_max, lag)
+                    if lag > 0.001:
+                        late += 1
+                    pending.add(executor.submit(send_request, client, policy, value, 1, run_start))
+            except KeyboardInterrupt:
+                print("Interrupted; waiting for in-flight requests")
+            done, _ = wait(pending)
+            collect(done)
+    finally:
+        client.close()
+    results.elapsed = time.perf_counter() - run_start
+
+    summary = results.summary()
+    sent = summary["requests"]
+    summary["trace_span"] = last_time - first_time  # 中断した場合は送ったところまで
+    summary["trace_sources"] = len(sources)
+    summary["lag_mean"] = lag_total / sent if sent else None
+    summary["lag_max"] = lag_max
+    summary["late_sends"] = late  # 予定より1ms以上遅れて送った数
+    summary["out_of_order"] = out_of_order  # 直前の記録より前に到着していた記録の数
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured request traces against a server pool.")
+    parser.add_argument('traces', nargs='+', help="Trace files written by server.py --capture.")
+    parser.add_argument('--servers', type=str, required=True, help="Comma-separated list of server addresses (host or host:port).")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed factor (2.0 = twice as fast as recorded).")
+    parser.add_argument('--policy', type=str, default="round_robin", help="Balancing policy name.")
+    parser.add_argument('--transport', type=str, default="channel", choices=TRANSPORTS, help="How channels are used.")
+    parser.add_argument('--max-inflight', type=int, default=200, help="Upper bound on outstanding requests.")
+    parser.add_argument('--limit', type=int, help="Replay only the first N requests.")
+    parser.add_argument('--out', type=str, help="Output path prefix (default: results/replay_<timestamp>).")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    servers = [server_address(server) for server in args.servers.split(',')]
+    scenario = {
+        "name": "replay",
+        "traces": args.traces,
+        "speed": args.speed,
+        "policy": {"type": args.policy},
+        "transport": args.transport,
+        "max_inflight": args.max_inflight,
+        "limit": args.limit,
+    }
+    prefix = args.out or os.path.join("results", f"replay_{time.strftime('%Y%m%d-%H%M%S')}")
+    summary = run_and_write(prefix, scenario, servers, runner=replay)
+    print(f"Replayed {summary['requests']} requests from {summary['trace_sources']} source(s) "
+          f"spanning {summary['trace_span']:.2f}s of the trace")
+    print(f"Throughput: {summary['throughput'] or 0:.1f} req/s, mean {summary['mean'] or 0:.4f}s, "
+          f"p99 {summary['p99'] or 0:.4f}s, errors {summary['errors']}")
+    print(f"Send lag: mean {(summary['lag_mean'] or 0) * 1000:.2f}ms, max {summary['lag_max'] * 1000:.2f}ms, "
+          f"{summary['late_sends']} sends more than 1ms late")
+    if summary["out_of_order"]:
+        print(f"Warning: {summary['out_of_order']} records came out of arrival order and were sent late")
+    print(f"Results written to {prefix}.json and {prefix}.csv")
+
+
+if __name__ == "__main__":
+    main()
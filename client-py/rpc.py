@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import grpc
+from isPrime import isPrime_pb2, isPrime_pb2_grpc
+
+# gRPCのログレベルを設定
+os.environ["GRPC_VERBOSITY"] = "NONE"
+
+DEFAULT_PORT = 9000
+
+# IsPrimeFunc サービスには単項RPC (CheckPrime) しかないため, 通信方式はチャネルの使い方で切り替える
+#   unary   : リクエストごとにチャネルを作って閉じる (これまでの test1.py〜test3.py と同じ)
+#   channel : サーバごとにチャネルを1本だけ作り, 全リクエストで使い回す
+TRANSPORTS = ("unary", "channel")
+
+
+def server_address(address):
+    """"host" または "host:port" を "host:port" にそろえる"""
+    address = address.strip()
+    return address if ':' in address else f"{address}:{DEFAULT_PORT}"
+
+
+def split_response_time(elapsed_time, trailing_metadata):
+    """サーバのトレーリングメタデータから応答時間をネットワーク・待ち・計算時間に分解する"""
+    metadata = dict(trailing_metadata or ())
+    if 'x-server-queue-us' not in metadata or 'x-server-compute-us' not in metadata:
+        # タイミング情報を返さないサーバの場合は分解できない
+        return None, None, None
+    queue_time = int(metadata['x-server-queue-us']) / 1e6
+    compute_time = int(metadata['x-server-compute-us']) / 1e6
+    network_time = max(elapsed_time - queue_time - compute_time, 0.0)
+    return network_time, queue_time, compute_time
+
+
+class PrimeClient:
+    """指定した通信方式でサーバに素数判定をリクエストする"""
+
+    def __init__(self, transport="unary"):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"unsupported transport '{transport}' (the service only has the unary CheckPrime RPC; choose from {', '.join(TRANSPORTS)})")
+        self.transport = transport
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _stub(self, server):
+        with self._lock:
+            if server not in self._channels:
+                self._channels[server] = grpc.insecure_channel(server)
+            return isPrime_pb2_grpc.IsPrimeFuncStub(self._channels[server])
+
+    def check_prime(self, server, number):
+        """応答と処理時間(全体・ネットワーク・待ち・計算)を返す. エラー時の応答は 'Error'"""
+        start_time = time.perf_counter()
+        try:
+            if self.transport == "unary":
+                with grpc.insecure_channel(server) as channel:
+                    stub = isPrime_pb2_grpc.IsPrimeFuncStub(channel)
+                    response, call = stub.CheckPrime.with_call(isPrime_pb2.Value(Value=number))
+            else:
+                response, call = self._stub(server).CheckPrime.with_call(isPrime_pb2.Value(Value=number))
+            elapsed_time = time.perf_counter() - start_time
+            return (response.IsPrime, elapsed_time) + split_response_time(elapsed_time, call.trailing_metadata())
+        except grpc.RpcError as e:
+            print(f"RPC Error: {e.code()} {e.details()}")
+            elapsed_time = time.perf_counter() - start_time
+            return 'Error', elapsed_time, None, None, None
+
+    def close(self):
+        with self._lock:
+            for channel in self._channels.values():
+                channel.close()
+            self._channels.clear()
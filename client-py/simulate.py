@@ -0,0 +1,472 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import os
+import statistics
+import time
+from collections import deque
+from functools import lru_cache
+from random import Random
+from bench import Results, compare, load_scenario
+from policies import make_policy
+from workloads import make_workload
+from prime import is_prime  # server-py/prime.py (workloads が読み込み先を設定する)
+
+SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+TRIAL_PRIMES = [p for p in range(2, 1000) if all(p % q for q in range(2, int(p**0.5) + 1))]
+TRIAL_PRODUCT = math.prod(TRIAL_PRIMES)  # 1000未満の素数の積 (gcd で小さい素因数の有無を一度に調べる)
+DEFAULT_MAX_WORKERS = 10  # server.py の既定のワーカースレッド数
+ARRIVE, COMPLETE, RESPOND = range(3)  # イベントの種類
+
+
+def is_probable_prime(n):
+    """Miller-Rabin (この基数なら 3.3 * 10^24 未満で確定的)"""
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in SMALL_PRIMES:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_brent(n):
+    """n (1000未満の素因数を持たない合成数) の自明でない約数を1つ返す (Brent版 Pollard のρ法)"""
+    for c in range(1, n):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                saved = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += 128
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                saved = (saved * saved + c) % n
+                g = math.gcd(abs(x - saved), n)
+        if g != n:
+            return g
+    raise ValueError(f"failed to factor {n}")
+
+
+def smallest_factor(n):
+    """n (合成数) の最小の素因数"""
+    if math.gcd(n, TRIAL_PRODUCT) > 1:
+        for p in TRIAL_PRIMES:
+            if n % p == 0:
+                return p
+    factors = [n]
+    result = n
+    while factors:
+        m = factors.pop()
+        if is_probable_prime(m):
+            result = min(result, m)
+        else:
+            d = pollard_brent(m)
+            factors += [d, m // d]
+    return result
+
+
+@lru_cache(maxsize=1 << 16)
+def trial_division_profile(number):
+    """server.py の試し割りが割り算を何回するか (処理時間はこれにほぼ比例する) と, 素数かどうか"""
+    if number < 2:
+        return 0, False
+    limit = int(number**0.5)
+    if math.gcd(number, TRIAL_PRODUCT) > 1:
+        # ほとんどの合成数は小さい素因数を持つので, Miller-Rabin より先に調べる
+        factor = smallest_factor(number)
+        if factor == number:
+            return max(limit - 1, 0), True
+        return factor - 1, False
+    if is_probable_prime(number):
+        return max(limit - 1, 0), True
+    return min(smallest_factor(number), limit + 1) - 1, False
+
+
+def iterations(number):
+    return trial_division_profile(number)[0]
+
+
+class ServiceModel:
+    """1リクエストの処理時間 (秒) を返すモデル
+
+    trial_division : base + per_iteration * 割り算の回数 (数ごとに決まる)
+    fixed          : 常に seconds
+    exponential    : 平均 mean の指数分布
+    empirical      : samples からランダムに選ぶ (記録済みの処理時間)
+    """
+
+    def __init__(self, spec, rng):
+        self.spec = dict(spec)
+        self.type = self.spec["type"]
+        self.rng = rng
+        if self.type not in ("trial_division", "fixed", "exponential", "empirical"):
+            raise ValueError(f"unknown service model '{self.type}'")
+
+    def sample(self, number):
+        spec = self.spec
+        if self.type == "trial_division":
+            return spec.get("base", 0.0) + spec["per_iteration"] * iterations(number)
+        if self.type == "fixed":
+            return spec["seconds"]
+        if self.type == "exponential":
+            return self.rng.expovariate(1 / spec["mean"])
+        return self.rng.choice(spec["samples"])
+
+
+class Job:
+    """シミュレーション中の1リクエスト"""
+    __slots__ = ("number", "server", "sent_at", "service", "arrival", "start", "done")
+
+    def __init__(self, number, server, sent_at, service):
+        self.number = number
+        self.server = server
+        self.sent_at = sent_at
+        self.service = service  # 必要なCPU時間 (秒)
+        self.arrival = self.start = self.done = None
+
+
+class Backend:
+    """サーバ1台のモデル: max_workers 個のワーカースレッドと, その後ろのFIFOの待ち行列
+
+    CPythonのサーバはGILのため, ワーカースレッドで処理中のRPCはCPUを分け合って進む
+    (プロセッサシェアリング). 処理中のRPCが n 個なら, それぞれ min(1, parallelism / n) の速さで進み,
+    軽いリクエストは重いリクエストより先に終わる. ワーカーが全て埋まっていると待ち行列で待つ.
+    parallelism は使えるCPUコア数 (プロセス数) で, ワーカーはプロセスごとに max_workers 個ある
+    (プロセスへの振り分けは均等とみなし, まとめて1つのプールとして扱う).
+    network はクライアントとの片道の遅延 (秒) で, 一定とする.
+
+    処理の進み具合は仮想時間 (1つのRPCが受け取ったCPU時間) で表す. RPCは仮想時間が
+    開始時の仮想時間 + 必要なCPU時間 に達したときに終わる.
+    """
+
+    def __init__(self, name, spec, rng):
+        self.name = name
+        self.parallelism = spec.get("parallelism", 1)
+        self.max_workers = spec.get("max_workers", DEFAULT_MAX_WORKERS)
+        self.workers = self.max_workers * self.parallelism
+        self.network = spec.get("network", 0.0)
+        self.service = ServiceModel(spec["service"], rng)
+        self.reset()
+
+    def reset(self):
+        self.virtual = 0.0  # 仮想時間
+        self.updated = 0.0  # virtual を最後に進めた実時間
+        self.active = []  # 処理中: (終わる仮想時間, 連番, Job) のヒープ
+        self.waiting = deque()  # ワーカーの空き待ち
+        self.version = 0  # 終了予定を立て直すたびに増やす (古い完了イベントを無視するため)
+        self._sequence = 0
+
+    def _advance(self, now):
+        if self.active:
+            self.virtual += (now - self.updated) * min(1.0, self.parallelism / len(self.active))
+        self.updated = now
+
+    def _start(self, now, job):
+        job.start = now
+        heapq.heappush(self.active, (self.virtual + job.service, self._sequence, job))
+        self._sequence += 1
+
+    def arrive(self, now, job):
+        """リクエストが届いた. ワーカーが空いていればすぐ処理を始める"""
+        self._advance(now)
+        job.arrival = now
+        if len(self.active) < self.workers:
+            self._start(now, job)
+        else:
+            self.waiting.append(job)
+
+    def finish(self, now):
+        """now までに終わったRPCを取り出し, 空いたワーカーで待ち行列の先頭を始める"""
+        self._advance(now)
+        finished = []
+        while self.active and self.active[0][0] <= self.virtual * (1 + 1e-12) + 1e-12:
+            job = heapq.heappop(self.active)[2]
+            job.done = now
+            finished.append(job)
+        while self.waiting and len(self.active) < self.workers:
+            self._start(now, self.waiting.popleft())
+        return finished
+
+    def next_completion(self):
+        """次にRPCが終わる実時間 (処理中が無ければ None)"""
+        if not self.active:
+            return None
+        rate = min(1.0, self.parallelism / len(self.active))
+        return self.updated + max(self.active[0][0] - self.virtual, 0.0) / rate
+
+
+def simulate_trial(scenario, backends, policy, numbers, trial, results, rng):
+    """1トライアル分をシミュレーションして経過時間 (最後の応答が届いた時刻) を返す
+
+    bench.py の run_trial と同じく, broadcast なら全ての数を全サーバに送り,
+    未完了のリクエストは max_inflight 個 (閉ループでは concurrency 個まで) に抑える.
+    開ループで上限に達したときは, どれかの応答が届くまで次の送信を遅らせる.
+    """
+    duration = scenario["duration"]
+    rate = scenario.get("rate")
+    if rate:
+        limit = scenario["max_inflight"] or math.inf
+    else:
+        limit = min(scenario["concurrency"], scenario["max_inflight"] or scenario["concurrency"])
+    targets = list(backends) if scenario["broadcast"] else [None]
+    jobs = ((target, number) for number in numbers for target in targets)
+    # イベント: (時刻, 連番, 種類, 対象). 種類は ARRIVE (サーバに届く), COMPLETE (サーバで終わる), RESPOND (応答が届く)
+    events = []
+    sequence = 0
+    inflight = 0
+    sent = 0
+    now = 0.0
+
+    def push(at, kind, item):
+        nonlocal sequence
+        heapq.heappush(events, (at, sequence, kind, item))
+        sequence += 1
+
+    def schedule(backend):
+        """backend の次の終了予定をイベントに入れる (前の予定は version で無効にする)"""
+        backend.version += 1
+        at = backend.next_completion()
+        if at is not None:
+            push(at, COMPLETE, (backend, backend.version))
+
+    def dispatch(at):
+        """at に1件送信する. 送るものが無ければ False"""
+        nonlocal inflight, sent
+        if duration is not None and at > duration:
+            return False
+        job = next(jobs, None)
+        if job is None:
+            return False
+        target, number = job
+        server = target or policy.choose()
+        policy.on_start(server)
+        backend = backends[server]
+        push(at + backend.network, ARRIVE, Job(number, server, at, backend.service.sample(number)))
+        inflight += 1
+        sent += 1
+        return True
+
+    next_arrival = None
+    if rate:
+        next_arrival = 0.0
+    else:
+        for _ in range(limit):
+            if not dispatch(0.0):
+                break
+
+    while events or next_arrival is not None:
+        if next_arrival is not None and (not events or next_arrival <= events[0][0]) and inflight < limit:
+            # 開ループ: 同じ時刻のイベントより先に次の到着を処理する (上限で待たされた分は now まで遅れる)
+            if dispatch(max(next_arrival, now)):
+                next_arrival += rng.expovariate(rate)
+            else:
+                next_arrival = None
+            continue
+        now, _, kind, item = heapq.heappop(events)
+        if kind == ARRIVE:
+            backend = backends[item.server]
+            backend.arrive(now, item)
+            schedule(backend)
+        elif kind == COMPLETE:
+            backend, version = item
+            if version != backend.version:
+                continue  # 処理中のRPC数が変わって予定が変わった
+            for job in backend.finish(now):
+                push(now + backend.network, RESPOND, job)
+            schedule(backend)
+        else:
+            job = item
+            inflight -= 1
+            response_time = now - job.sent_at
+            policy.on_finish(job.server, response_time)
+            sample = {
+                "Trial": trial,
+                "Number": job.number,
+                "Server": job.server,
+                "IsPrime": 'T' if trial_division_profile(job.number)[1] else 'F',
+                "StartTime": job.sent_at,
+                "ResponseTime": response_time,
+                "NetworkTime": 2 * backends[job.server].network,
+                "QueueTime": job.start - job.arrival,
+                "ComputeTime": job.done - job.start,
+            }
+            results.record(sample)
+            if not rate:
+                dispatch(now)
+    for backend in backends.values():
+        backend.reset()  # 次のトライアルは空いたサーバから始める
+    if trial:
+        print(f"Trial {trial}: {sent} requests in {now:.2f}s (simulated)")
+    return now
+
+
+def simulate(scenario, model, sink=None, seed=0):
+    """シナリオを離散イベントシミュレーションで実行し, bench.py と同じ形式の集計結果を返す
+
+    閉ループ (rate 未指定): concurrency 個のクライアントが応答を受けるたびに次を送る (bench.py と同じ).
+    開ループ (rate 指定)  : 平均 rate 件/秒のポアソン到着で送る.
+    warmup があれば bench.py と同じく最初に送り, 集計には含めない.
+    """
+    rng = Random(seed)
+    backends = {name: Backend(name, spec, rng) for name, spec in model["backends"].items()}
+    policy = make_policy(scenario["policy"], list(backends))
+    results = Results(sink)
+    if scenario["count"] is None and scenario["duration"] is None:
+        raise ValueError("the simulation needs 'count' or 'duration'")
+
+    if scenario["warmup"]:
+        warmup = make_workload(scenario["workload"], scenario["warmup"])
+        simulate_trial({**scenario, "duration": None}, backends, policy, warmup, 0, Results(), rng)
+    for trial in range(1, scenario["trials"] + 1):
+        numbers = make_workload(scenario["workload"], scenario["count"])
+        results.elapsed += simulate_trial(scenario, backends, policy, numbers, trial, results, rng)
+    return results.summary()
+
+
+def fit_line(xs, ys):
+    """最小二乗法で y = a + b x を求めて (a, b) を返す"""
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return 0.0, mean_y / mean_x if mean_x else 0.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    return max(mean_y - slope * mean_x, 0.0), slope
+
+
+def calibrate_local(samples=200, seed=1):
+    """このマシンでサーバの is_prime の処理時間を測り, trial_division モデルの係数を求める"""
+    rng = Random(seed)
+    numbers = [rng.randint(10**k, 10**(k + 1)) for k in range(4, 11) for _ in range(samples // 7)]
+    numbers += [9389934469, 2]
+    xs, ys = [], []
+    for number in numbers:
+        start = time.perf_counter()
+        is_prime(number)
+        ys.append(time.perf_counter() - start)
+        xs.append(iterations(number))
+    base, per_iteration = fit_line(xs, ys)
+    return {"type": "trial_division", "base": base, "per_iteration": per_iteration}
+
+
+def calibrate_results(prefix, parallelism=1, max_workers=DEFAULT_MAX_WORKERS):
+    """bench.py の結果 (<prefix>.json と <prefix>.csv) からサーバごとのモデルを求める
+
+    処理時間は割り算の回数に対して直線で近似し, 片道の遅延は NetworkTime の中央値の半分とする
+    """
+    with open(prefix + ".json") as f:
+        concurrency = json.load(f)["scenario"].get("concurrency", 1)
+    if concurrency > parallelism:
+        print(f"Warning: {prefix} ran with concurrency {concurrency}; ComputeTime includes GIL contention "
+              f"and will overestimate service times. Calibrate from a concurrency 1 run if possible.")
+    per_server = {}
+    with open(prefix + ".csv", newline='') as f:
+        for row in csv.DictReader(f):
+            if row["IsPrime"] not in ('T', 'F') or not row["ComputeTime"]:
+                continue
+            per_server.setdefault(row["Server"], []).append(row)
+    backends = {}
+    for server, rows in per_server.items():
+        xs = [iterations(int(row["Number"])) for row in rows]
+        ys = [float(row["ComputeTime"]) for row in rows]
+        base, per_iteration = fit_line(xs, ys)
+        network = statistics.median(float(row["NetworkTime"]) for row in rows) / 2
+        backends[server] = {
+            "parallelism": parallelism,
+            "max_workers": max_workers,
+            "network": network,
+            "service": {"type": "trial_division", "base": base, "per_iteration": per_iteration},
+        }
+        print(f"{server}: base {base * 1e6:.1f}us, {per_iteration * 1e9:.2f}ns/iteration, one-way network {network * 1000:.2f}ms ({len(rows)} samples)")
+    return {"backends": backends}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discrete-event simulator for balancing policies and capacity planning.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="Build a backend model from local measurements or bench results.")
+    calibrate_parser.add_argument('--results', type=str, help="Prefix of a bench.py result (<prefix>.json/.csv). Without it, measure CheckPrime on this machine.")
+    calibrate_parser.add_argument('--servers', type=str, help="Comma-separated backend names for a local calibration (default: node1,node2).")
+    calibrate_parser.add_argument('--parallelism', type=int, default=1, help="CPU cores (server processes) per backend.")
+    calibrate_parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, help="Worker threads per server process (server.py --max-workers).")
+    calibrate_parser.add_argument('--out', type=str, required=True, help="Where to write the model JSON.")
+
+    run_parser = subparsers.add_parser("run", help="Simulate a bench.py scenario against a model.")
+    run_parser.add_argument('scenario', type=str, help="Path to the scenario JSON file.")
+    run_parser.add_argument('--model', type=str, required=True, help="Model JSON written by 'calibrate' (or by hand).")
+    run_parser.add_argument('--count', type=int, help="Requests per trial (overrides the scenario).")
+    run_parser.add_argument('--rate', type=float, help="Open-loop Poisson arrivals per second instead of a closed loop.")
+    run_parser.add_argument('--policy', type=str, help="Balancing policy name (overrides the scenario).")
+    run_parser.add_argument('--seed', type=int, default=0, help="Random seed for the service-time models.")
+    run_parser.add_argument('--compare', type=str, help="bench.py result JSON to compare the prediction with.")
+    run_parser.add_argument('--out', type=str, help="Write the predicted summary to this JSON file.")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        if args.results:
+            model = calibrate_results(args.results, args.parallelism, args.max_workers)
+        else:
+            service = calibrate_local()
+            print(f"Local CheckPrime: base {service['base'] * 1e6:.1f}us, {service['per_iteration'] * 1e9:.2f}ns/iteration")
+            names = args.servers.split(',') if args.servers else ["node1", "node2"]
+            model = {"backends": {name: {"parallelism": args.parallelism, "max_workers": args.max_workers, "network": 0.0005,
+                                         "service": service} for name in names}}
+        with open(args.out, "w") as f:
+            json.dump(model, f, indent=2)
+        print(f"Model written to {args.out}")
+        return
+
+    scenario = load_scenario(args.scenario)
+    if args.count:
+        scenario["count"] = args.count
+    if args.policy:
+        scenario["policy"] = {"type": args.policy}
+    scenario["rate"] = args.rate
+    with open(args.model) as f:
+        model = json.load(f)
+
+    wall_start = time.perf_counter()
+    summary = simulate(scenario, model, seed=args.seed)
+    wall = time.perf_counter() - wall_start
+    print(f"Predicted throughput: {summary['throughput'] or 0:.1f} req/s, mean {summary['mean'] or 0:.4f}s, "
+          f"p50 {summary['p50'] or 0:.4f}s, p99 {summary['p99'] or 0:.4f}s "
+          f"({summary['requests']} requests simulated in {wall:.1f}s)")
+
+    out = args.out
+    if args.compare and not out:
+        out = os.path.splitext(args.compare)[0] + ".predicted.json"
+    if out:
+        with open(out, "w") as f:
+            json.dump({"scenario": scenario, "model": model, "summary": summary}, f, indent=2)
+    if args.compare:
+        compare([args.compare, out])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import product
+from bench import load_scenario, run_scenario
+
+CLUSTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server-py", "cluster.py")
+POINT_COLUMNS = ["Threads", "Processes", "Concurrency", "Requests", "Errors", "Throughput", "P50", "P99", "Knee"]
+
+DEFAULT_SWEEP = {
+    "threads": [1, 2, 5, 10, 20, 50, 100],
+    "processes": [1],
+    "concurrency": [1, 2, 5, 10, 20, 50, 100],
+    "count": 500,  # 1点あたりのリクエスト数
+    "warmup": 20,
+    "node": {},  # cluster.py のノード設定 (cpus, slowdown など)
+    "port": 9151,
+    "gain_threshold": 0.05,  # スループットの伸びがこれ未満なら「伸びが止まった」
+    "latency_threshold": 0.10,  # p99 の増加がこれを超えたら「遅延が増え始めた」
+}
+
+
+class ServerUnderTest:
+    """cluster.py を使って1ノード分のサーバを起動・停止する"""
+
+    def __init__(self, node, port):
+        self.node = node
+        self.port = port
+        self._process = None
+        self._config = None
+
+    def start(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"base_port": self.port, "metrics_base_port": 0, "nodes": [self.node]}, f)
+            self._config = f.name
+        self._process = subprocess.Popen([sys.executable, CLUSTER_SCRIPT, self._config], stdout=subprocess.PIPE, text=True)
+        # cluster.py は起動が終わると "READY <servers>" を出力する
+        for line in self._process.stdout:
+            if line.startswith("READY "):
+                return line.split()[1].split(',')
+        self.stop()
+        raise RuntimeError(f"cluster.py exited before the server became ready (node: {self.node})")
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._config is not None:
+            os.remove(self._config)
+            self._config = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def find_knee(points, gain_threshold, latency_threshold):
+    """同時リクエスト数を増やしていき, スループットが伸びなくなり p99 が増え始める直前の点を返す
+
+    スイープした範囲でそうならなかった (まだ伸びている) 場合は None を返す
+    """
+    points = sorted(points, key=lambda point: point["Concurrency"])
+    for previous, current in zip(points, points[1:]):
+        gain = current["Throughput"] / previous["Throughput"] - 1 if previous["Throughput"] else 0.0
+        rise = current["P99"] / previous["P99"] - 1 if previous["P99"] else 0.0
+        if gain < gain_threshold and rise > latency_threshold:
+            return previous
+    return None
+
+
+def load_sweep(path):
+    """スイープ設定ファイル(JSON)を読み込む. scenario はこのファイルからの相対パス"""
+    with open(path) as f:
+        sweep = {**DEFAULT_SWEEP, **json.load(f)}
+    if "scenario" not in sweep:
+        raise ValueError(f"sweep '{path}' is missing 'scenario'")
+    sweep["scenario"] = os.path.join(os.path.dirname(os.path.abspath(path)), sweep["scenario"])
+    sweep.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return sweep
+
+
+def run_sweep(sweep):
+    """スレッド数 × プロセス数 × 同時リクエスト数の全ての組み合わせを計測する"""
+    base_scenario = load_scenario(sweep["scenario"])
+    points = []
+    for threads, processes in product(sweep["threads"], sweep["processes"]):
+        node = {**sweep["node"], "name": f"t{threads}p{processes}", "max_workers": threads,
+                "extra_args": sweep["node"].get("extra_args", []) + ["--processes", str(processes)]}
+        with ServerUnderTest(node, sweep["port"]) as servers:
+            for concurrency in sweep["concurrency"]:
+                scenario = {**base_scenario, "concurrency": concurrency, "count": sweep["count"],
+                            "trials": 1, "warmup": sweep["warmup"], "duration": None}
+                summary = run_scenario(scenario, servers)
+                point = {
+                    "Threads": threads,
+                    "Processes": processes,
+                    "Concurrency": concurrency,
+                    "Requests": summary["requests"],
+                    "Errors": summary["errors"],
+                    "Throughput": summary["throughput"] or 0.0,
+                    "P50": summary["p50"],
+                    "P99": summary["p99"],
+                    "Knee": False,
+                }
+                print(f"threads={threads} processes={processes} concurrency={concurrency}: "
+                      f"{point['Throughput']:.1f} req/s, p99 {(point['P99'] or 0) * 1000:.1f}ms")
+                points.append(point)
+    return points
+
+
+def summarize_sweep(points, sweep):
+    """サーバ設定ごとの膝 (knee) と, 膝のうち最も高いスループットが出た設定を求める
+
+    膝が見つからなかった設定は (threads, processes) のリストで別に返し, best の候補にしない
+    """
+    knees = []
+    no_knee = []
+    for threads, processes in product(sweep["threads"], sweep["processes"]):
+        config_points = [p for p in points if p["Threads"] == threads and p["Processes"] == processes]
+        knee = find_knee(config_points, sweep["gain_threshold"], sweep["latency_threshold"])
+        if knee is None:
+            no_knee.append((threads, processes))
+            continue
+        knee["Knee"] = True
+        knees.append(knee)
+    best = max(knees, key=lambda point: (point["Throughput"], -(point["P99"] or 0))) if knees else None
+    return knees, no_knee, best
+
+
+def print_table(points, sweep):
+    """行がサーバ設定, 列が同時リクエスト数の表 (スループット/p99) を表示する. * が膝 (無ければ行末に no knee)"""
+    width = 18
+    print(f"{'threads x procs':<16}" + "".join(f"{'c=' + str(c):>{width}}" for c in sweep["concurrency"]))
+    for threads, processes in product(sweep["threads"], sweep["processes"]):
+        cells = []
+        for concurrency in sweep["concurrency"]:
+            point = next(p for p in points if (p["Threads"], p["Processes"], p["Concurrency"]) == (threads, processes, concurrency))
+            mark = "*" if point["Knee"] else " "
+            cells.append(f"{point['Throughput']:.0f}/{(point['P99'] or 0) * 1000:.0f}ms{mark}")
+        knee = any(p["Knee"] for p in points if (p["Threads"], p["Processes"]) == (threads, processes))
+        print(f"{f'{threads} x {processes}':<16}" + "".join(f"{cell:>{width}}" for cell in cells) + ("" if knee else "  no knee"))
+
+
+def plot(points, sweep, path):
+    """スループットとp99のグラフを保存する (matplotlib が無ければ何もしない)"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; skipping the plot")
+        return False
+    fig, (ax_throughput, ax_latency) = plt.subplots(1, 2, figsize=(12, 5))
+    for threads, processes in product(sweep["threads"], sweep["processes"]):
+        config_points = sorted((p for p in points if p["Threads"] == threads and p["Processes"] == processes), key=lambda p: p["Concurrency"])
+        label = f"{threads} threads x {processes} proc"
+        concurrency = [p["Concurrency"] for p in config_points]
+        line, = ax_throughput.plot(concurrency, [p["Throughput"] for p in config_points], marker="o", label=label)
+        ax_latency.plot(concurrency, [(p["P99"] or 0) * 1000 for p in config_points], marker="o", color=line.get_color(), label=label)
+        for p in config_points:
+            if p["Knee"]:
+                ax_throughput.plot(p["Concurrency"], p["Throughput"], marker="*", markersize=14, color=line.get_color())
+    ax_throughput.set(xscale="log", xlabel="client concurrency", ylabel="throughput (req/s)", title="Throughput (* = knee)")
+    ax_latency.set(xscale="log", xlabel="client concurrency", ylabel="p99 latency (ms)", title="p99 latency")
+    ax_throughput.legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(path)
+    return True
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep server threads x processes x client concurrency to find the throughput knee.")
+    parser.add_argument('sweep', type=str, help="Path to the sweep JSON file.")
+    parser.add_argument('--threads', type=parse_list, help="Comma-separated worker thread counts (overrides the file).")
+    parser.add_argument('--processes', type=parse_list, help="Comma-separated server process counts (overrides the file).")
+    parser.add_argument('--concurrency', type=parse_list, help="Comma-separated client concurrency levels (overrides the file).")
+    parser.add_argument('--out', type=str, help="Output path prefix (default: results/sweep_<name>_<timestamp>).")
+    args = parser.parse_args()
+
+    sweep = load_sweep(args.sweep)
+    for key in ("threads", "processes", "concurrency"):
+        if getattr(args, key):
+            sweep[key] = getattr(args, key)
+
+    points = run_sweep(sweep)
+    knees, no_knee, best = summarize_sweep(points, sweep)
+
+    prefix = args.out or os.path.join("results", f"sweep_{sweep['name']}_{time.strftime('%Y%m%d-%H%M%S')}")
+    if os.path.dirname(prefix):
+        os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    with open(prefix + ".csv", "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=POINT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(points)
+    with open(prefix + ".json", "w") as f:
+        json.dump({"sweep": sweep, "points": points, "knees": knees,
+                   "no_knee": [{"Threads": t, "Processes": p} for t, p in no_knee], "best": best}, f, indent=2)
+
+    print()
+    print_table(points, sweep)
+    print()
+    for threads, processes in no_knee:
+        print(f"{threads} threads x {processes} processes: no knee within the grid "
+              f"(throughput still rising at concurrency {max(sweep['concurrency'])}; extend --concurrency)")
+    if best is not None:
+        print(f"Best: {best['Threads']} threads x {best['Processes']} processes, knee at concurrency {best['Concurrency']} "
+              f"({best['Throughput']:.1f} req/s, p99 {(best['P99'] or 0) * 1000:.1f}ms)")
+    else:
+        print("Best: none (no configuration reached its knee within the grid)")
+    written = [prefix + ".csv", prefix + ".json"]
+    if plot(points, sweep, prefix + ".png"):
+        written.append(prefix + ".png")
+    print(f"Results written to {', '.join(written)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import time
+import urllib.request
+from collections import defaultdict
+
+DEFAULT_METRICS_PORT = 9180  # server.py --metrics-port の推奨値
+
+
+def scrape(endpoint, timeout=2.0):
+    """/metrics を取得して {メトリクス名: 値} と {ヒストグラム名: [(le, 累積数)]} を返す"""
+    with urllib.request.urlopen(f"http://{endpoint}/metrics", timeout=timeout) as response:
+        text = response.read().decode()
+    values = {}
+    buckets = defaultdict(list)
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        if '_bucket{le="' in name:
+            base, le = name.split('_bucket{le="')
+            buckets[base].append((float(le.rstrip('"}')), float(value)))
+        else:
+            values[name] = float(value)
+    return values, buckets
+
+
+def histogram_quantile(q, buckets):
+    """累積バケットから分位点を線形補間で推定する (Prometheusの histogram_quantile と同じ考え方)"""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    total = buckets[-1][1]
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float('inf'):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def bucket_delta(current, previous):
+    """前回のスクレイプからの増分だけのバケットを返す (サーバ起動からの累積ではなく直近の分布を見るため)
+
+    前回の値が無い, またはサーバが再起動してカウンタが戻った場合は None を返す
+    """
+    if not previous or len(previous) != len(current) or current[-1][1] < previous[-1][1]:
+        return None
+    return [(bound, count - previous_count) for (bound, count), (_, previous_count) in zip(current, previous)]
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:8.2f}" if seconds is not None else f"{'-':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll the servers' /metrics endpoints and show a live summary.")
+    parser.add_argument('ip_addresses', type=str, help="Comma-separated list of server IP addresses (host or host:port).")
+    parser.add_argument('--port', type=int, default=DEFAULT_METRICS_PORT, help="Metrics port used when an address has no port.")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between scrapes (p50/p99 cover the requests finished in this interval).")
+    args = parser.parse_args()
+
+    endpoints = [ip.strip() if ':' in ip else f"{ip.strip()}:{args.port}" for ip in args.ip_addresses.split(',')]
+
+    previous = {}  # エンドポイントごとの前回のバケット
+    header = f"{'Server':<22}{'InFlight':>9}{'Queue':>7}{'Busy%':>7}{'RPS':>9}{'Total':>10}{'Errors':>8}{'p50 ms':>9}{'p99 ms':>9}"
+    try:
+        while True:
+            print(time.strftime('%H:%M:%S'))
+            print(header)
+            for endpoint in endpoints:
+                try:
+                    values, buckets = scrape(endpoint)
+                except OSError as e:
+                    print(f"{endpoint:<22} unreachable: {e}")
+                    continue
+                current = buckets.get('likelb_compute_seconds', [])
+                compute = bucket_delta(current, previous.get(endpoint))
+                previous[endpoint] = current
+                print(f"{endpoint:<22}"
+                      f"{values.get('likelb_inflight_requests', 0):>9.0f}"
+                      f"{values.get('likelb_executor_queue_depth', 0):>7.0f}"
+                      f"{values.get('likelb_worker_busy_ratio', 0) * 100:>7.1f}"
+                      f"{values.get('likelb_requests_per_second', 0):>9.1f}"
+                      f"{values.get('likelb_requests_total', 0):>10.0f}"
+                      f"{values.get('likelb_request_errors_total', 0):>8.0f}"
+                      f" {format_ms(histogram_quantile(0.5, compute) if compute else None)}"
+                      f" {format_ms(histogram_quantile(0.99, compute) if compute else None)}")
+            print()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
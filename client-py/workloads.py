@@ -0,0 +1,96 @@
+import csv
+import os
+import sys
+from itertools import count as counter, cycle, islice
+from random import Random
+
+# トレースの形式はサーバと共有する (server-py/tracefile.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server-py"))
+import tracefile
+
+# これまでの実験で使った数
+HEAVY_PRIME = 9389934469  # 10桁の素数 (処理が重い)
+LIGHT_NUMBER = 2  # 処理が軽い数
+
+# 各ワークロードは数を1つずつ返すイテレータ. count が None なら無限に続く
+
+
+def limit(numbers, count):
+    return numbers if count is None else islice(numbers, count)
+
+
+def random_numbers(count, seed=42, low=10**9, high=10**11 - 1):
+    """10桁から11桁の疑似乱数を生成する (実験1)"""
+    rng = Random(seed)
+    return limit((rng.randint(low, high) for _ in counter()), count)
+
+
+def fixed_numbers(count, value=HEAVY_PRIME):
+    """固定された数を生成する (実験2)"""
+    return limit((value for _ in counter()), count)
+
+
+def alternating_numbers(count, values=(HEAVY_PRIME, LIGHT_NUMBER)):
+    """与えた数を交互に生成する (実験3)"""
+    return limit(cycle(values), count)
+
+
+def zipf_numbers(count, seed=42, distinct=1000, exponent=1.1, low=10**9, high=10**11 - 1):
+    """Zipf分布に従って偏った数を生成する (よく来る数とめったに来ない数がある)"""
+    rng = Random(seed)
+    population = [rng.randint(low, high) for _ in range(distinct)]
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, distinct + 1):
+        total += 1 / rank ** exponent
+        cum_weights.append(total)
+    return limit((rng.choices(population, cum_weights=cum_weights)[0] for _ in counter()), count)
+
+
+def read_trace(path):
+    """記録済みの数列を1つずつ読む (server.py --capture のトレース, 1行1個のテキスト, または Number 列を持つCSV)"""
+    if tracefile.is_trace_file(path):
+        for record in tracefile.read_trace(path):
+            yield record.value
+        return
+    with open(path, newline='') as f:
+        first = f.readline()
+        f.seek(0)
+        if 'Number' in first:
+            for row in csv.DictReader(f):
+                yield int(row['Number'])
+        else:
+            for line in f:
+                if line.strip():
+                    yield int(line)
+
+
+def trace_numbers(count, path):
+    """記録済みの数列を読み込む. count が記録より多い (または None の) 場合は先頭から繰り返す"""
+    def repeat():
+        while True:
+            empty = True
+            for number in read_trace(path):
+                empty = False
+                yield number
+            if empty:
+                raise ValueError(f"trace '{path}' contains no numbers")
+    return limit(repeat(), count)
+
+
+WORKLOADS = {
+    "random": random_numbers,
+    "fixed": fixed_numbers,
+    "alternating": alternating_numbers,
+    "zipf": zipf_numbers,
+    "trace": trace_numbers,
+}
+
+
+def make_workload(spec, count):
+    """シナリオの "workload" ({"type": ..., その他の引数}) から数のイテレータを作る"""
+    spec = dict(spec)
+    name = spec.pop("type")
+    if name not in WORKLOADS:
+        raise ValueError(f"unknown workload '{name}' (choose from {', '.join(WORKLOADS)})")
+    return WORKLOADS[name](count, **spec)
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+PROXY_PORT_OFFSET = 1000  # 遅延を入れるノードでは server.py を「公開ポート + この値」で起動する
+
+
+class DelayProxy:
+    """TCP接続を中継し, 片道ごとに遅延とジッタを加える
+
+    tc netem (root権限が必要) の代わりに使う. 到着順は保ったまま, 各チャンクを
+    delay ± jitter 秒後に送り出す. 遅延はワーカースレッドを占有しない.
+    """
+
+    def __init__(self, listen_port, target_port, delay_ms=0.0, jitter_ms=0.0, host="127.0.0.1", seed=None):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.delay = delay_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.host = host
+        self._random = random.Random(seed)
+
+    def _next_delay(self):
+        return max(self.delay + self._random.uniform(-self.jitter, self.jitter), 0.0)
+
+    async def _pipe(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def send():
+            while True:
+                release, data = await queue.get()
+                wait = release - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        sender = asyncio.create_task(send())
+        last_release = 0.0
+        try:
+            while True:
+                data = await reader.read(65536)
+                # 追い越しが起きないよう, 送出時刻は前のチャンク以降にする
+                last_release = max(loop.time() + self._next_delay(), last_release)
+                queue.put_nowait((last_release, data))
+                if not data:
+                    break
+        except ConnectionError:
+            queue.put_nowait((0.0, b""))
+        try:
+            await sender
+        except ConnectionError:
+            pass
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.host, self.target_port)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(self._pipe(client_reader, server_writer), self._pipe(server_reader, client_writer))
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.listen_port)
+
+    def close(self):
+        self._server.close()
+
+
+def wait_for_port(host, port, process=None, timeout=10.0):
+    """ポートが接続を受け付けるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server for {host}:{port} exited with code {process.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{host}:{port} did not start listening within {timeout}s")
+
+
+class Cluster:
+    """ローカルで server.py を複数起動して, 性能の違うサーバ群を模擬する
+
+    各ノードの設定 (省略可):
+      name        : 表示名
+      port        : 公開ポート (既定は base_port + 番号)
+      cpus        : 割り当てるCPU番号のリスト
+      max_workers : ワーカースレッド数
+      slowdown    : 処理時間 (CPU時間) を何倍に引き延ばすか
+      delay_ms    : 片道の遅延 (ミリ秒)
+      jitter_ms   : 遅延のゆらぎ (ミリ秒)
+      extra_args  : server.py にそのまま渡す追加の引数
+    """
+
+    def __init__(self, nodes, host="127.0.0.1", base_port=9101, metrics_base_port=9201, log_dir=None):
+        self.nodes = [dict(node) for node in nodes]
+        self.host = host
+        self.base_port = base_port
+        self.metrics_base_port = metrics_base_port
+        self.log_dir = log_dir
+        self._processes = []
+        self._logs = []
+        self._proxies = []
+        self._loop = None
+
+    @property
+    def servers(self):
+        return [f"{self.host}:{node['port']}" for node in self.nodes]
+
+    def _start_loop(self):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    def start(self):
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+        for index, node in enumerate(self.nodes):
+            node.setdefault("name", f"node{index + 1}")
+            node.setdefault("port", self.base_port + index)
+            node.setdefault("metrics_port", self.metrics_base_port + index if self.metrics_base_port else 0)
+            delayed = node.get("delay_ms", 0) or node.get("jitter_ms", 0)
+            server_port = node["port"] + PROXY_PORT_OFFSET if delayed else node["port"]
+
+            command = [sys.executable, SERVER_SCRIPT, "--port", str(server_port), "--metrics-port", str(node["metrics_port"]),
+                       "--metrics-host", self.host]
+            if node.get("max_workers"):
+                command += ["--max-workers", str(node["max_workers"])]
+            if node.get("cpus"):
+                command += ["--cpus", ",".join(str(cpu) for cpu in node["cpus"])]
+            if node.get("slowdown"):
+                command += ["--slowdown", str(node["slowdown"])]
+            command += node.get("extra_args", [])
+            log = open(os.path.join(self.log_dir, f"{node['name']}.log"), "w") if self.log_dir else subprocess.DEVNULL
+            if self.log_dir:
+                self._logs.append(log)
+            self._processes.append(subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env={**os.environ, "PYTHONUNBUFFERED": "1"}))
+
+            if delayed:
+                if self._loop is None:
+                    self._start_loop()
+                proxy = DelayProxy(node["port"], server_port, node.get("delay_ms", 0), node.get("jitter_ms", 0), host=self.host)
+                asyncio.run_coroutine_threadsafe(proxy.start(), self._loop).result()
+                self._proxies.append(proxy)
+
+        try:
+            for node, process in zip(self.nodes, self._processes):
+                delayed = node.get("delay_ms", 0) or node.get("jitter_ms", 0)
+                wait_for_port(self.host, node["port"] + PROXY_PORT_OFFSET if delayed else node["port"], process)
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def poll(self):
+        """終了してしまったノードの名前のリストを返す"""
+        return [node["name"] for node, process in zip(self.nodes, self._processes) if process.poll() is not None]
+
+    def stop(self):
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes = []
+        for log in self._logs:
+            log.close()
+        self._logs = []
+        if self._loop is not None:
+            for proxy in self._proxies:
+                self._loop.call_soon_threadsafe(proxy.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+        self._proxies = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def load_cluster(path):
+    """クラスタ設定ファイル(JSON)を読み込んで Cluster を作る (起動はしない)"""
+    with open(path) as f:
+        config = json.load(f)
+    return Cluster(config["nodes"],
+                   host=config.get("host", "127.0.0.1"),
+                   base_port=config.get("base_port", 9101),
+                   metrics_base_port=config.get("metrics_base_port", 9201),
+                   log_dir=config.get("log_dir"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Launch several local prime servers with simulated capacity differences.")
+    parser.add_argument('config', type=str, help="Path to the cluster JSON file.")
+    parser.add_argument('--log-dir', type=str, help="Write each node's output to <log-dir>/<name>.log.")
+    args = parser.parse_args()
+
+    cluster = load_cluster(args.config)
+    if args.log_dir:
+        cluster.log_dir = args.log_dir
+    # terminate されたときも with を抜けて各ノードを止める
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with cluster:
+        for node, server in zip(cluster.nodes, cluster.servers):
+            profile = ", ".join(f"{key}={node[key]}" for key in ("cpus", "max_workers", "slowdown", "delay_ms", "jitter_ms") if node.get(key))
+            print(f"{node['name']:<10} {server:<18} metrics :{node['metrics_port']}  {profile or 'no limits'}")
+        # 他のツールはこの行を読んで起動完了を知る
+        print(f"READY {','.join(cluster.servers)}", flush=True)
+        try:
+            while True:
+                stopped = cluster.poll()
+                if stopped:
+                    print(f"Node(s) exited: {', '.join(stopped)}")
+                    break
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
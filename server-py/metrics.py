@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 処理時間ヒストグラムのバケット境界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RPS_WINDOW_SECONDS = 10  # requests/sec を計算する直近の秒数
+WORKER_THREAD_PREFIX = "rpc-worker"  # ワーカースレッド名の接頭辞 (プロファイラが使う)
+
+
+class Histogram:
+    """Prometheus形式の累積ヒストグラム (ロックは呼び出し側で取る)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class ServerMetrics:
+    """実行中のサーバの状態を集計する
+
+    更新は1リクエストあたりロック数回だけなので, 常時有効にしておいても負荷は小さい
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.queued = 0  # スレッドプールで実行待ちのRPC数
+        self.busy = 0  # 実行中のワーカースレッド数
+        self.requests_total = 0
+        self.errors_total = 0
+        self.compute_seconds = Histogram()
+        self.queue_seconds = Histogram()
+        # 直近 RPS_WINDOW_SECONDS 秒の [秒, 完了数] (requests/sec 用)
+        self._recent = deque()
+        self._started = time.monotonic()
+
+    def task_submitted(self):
+        with self._lock:
+            self.queued += 1
+
+    def task_started(self):
+        with self._lock:
+            self.queued -= 1
+            self.busy += 1
+
+    def task_finished(self):
+        with self._lock:
+            self.busy -= 1
+
+    def rpc_finished(self, queue_time, compute_time, ok):
+        """TimingInterceptor から1リクエスト完了ごとに呼ばれる"""
+        second = int(time.monotonic())
+        with self._lock:
+            self.requests_total += 1
+            if not ok:
+                self.errors_total += 1
+            self.queue_seconds.observe(queue_time)
+            self.compute_seconds.observe(compute_time)
+            if self._recent and self._recent[-1][0] == second:
+                self._recent[-1][1] += 1
+            else:
+                self._recent.append([second, 1])
+            while self._recent[0][0] <= second - RPS_WINDOW_SECONDS:
+                self._recent.popleft()
+
+    def requests_per_second(self):
+        """直近 RPS_WINDOW_SECONDS 秒間の平均 requests/sec (ロックは呼び出し側で取る)"""
+        now = time.monotonic()
+        window = min(RPS_WINDOW_SECONDS, max(now - self._started, 1.0))
+        completed = sum(count for second, count in self._recent if second > int(now) - RPS_WINDOW_SECONDS)
+        return completed / window
+
+    def render(self):
+        """Prometheusのテキスト形式で出力する"""
+        with self._lock:
+            lines = [
+                "# HELP likelb_inflight_requests RPCs accepted and not yet finished (queued + running).",
+                "# TYPE likelb_inflight_requests gauge",
+                f"likelb_inflight_requests {self.queued + self.busy}",
+                "# HELP likelb_executor_queue_depth RPCs waiting for a worker thread.",
+                "# TYPE likelb_executor_queue_depth gauge",
+                f"likelb_executor_queue_depth {self.queued}",
+                "# HELP likelb_workers_max Size of the worker thread pool.",
+                "# TYPE likelb_workers_max gauge",
+                f"likelb_workers_max {self.max_workers}",
+                "# HELP likelb_worker_busy_ratio Fraction of worker threads running an RPC.",
+                "# TYPE likelb_worker_busy_ratio gauge",
+                f"likelb_worker_busy_ratio {self.busy / self.max_workers}",
+                f"# HELP likelb_requests_per_second Completed RPCs per second over the last {RPS_WINDOW_SECONDS}s.",
+                "# TYPE likelb_requests_per_second gauge",
+                f"likelb_requests_per_second {self.requests_per_second()}",
+                "# HELP likelb_requests_total Completed RPCs.",
+                "# TYPE likelb_requests_total counter",
+                f"likelb_requests_total {self.requests_total}",
+                "# HELP likelb_request_errors_total RPCs that raised or aborted.",
+                "# TYPE likelb_request_errors_total counter",
+                f"likelb_request_errors_total {self.errors_total}",
+            ]
+            lines += self.compute_seconds.render("likelb_compute_seconds", "Time spent in CheckPrime.")
+            lines += self.queue_seconds.render("likelb_queue_seconds", "Time between arrival and start of work.")
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedThreadPoolExecutor(futures.ThreadPoolExecutor):
+    """待ち行列の長さと稼働中スレッド数を ServerMetrics に通知するスレッドプール"""
+
+    def __init__(self, metrics, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix=WORKER_THREAD_PREFIX)
+        self._metrics = metrics
+
+    def submit(self, fn, /, *args, **kwargs):
+        metrics = self._metrics
+
+        def run():
+            metrics.task_started()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.task_finished()
+
+        metrics.task_submitted()
+        try:
+            return super().submit(run)
+        except Exception:
+            metrics.task_started()
+            metrics.task_finished()
+            raise
+
+
+def start_metrics_server(metrics, port, routes=None, host="127.0.0.1"):
+    """/metrics をPrometheusのテキスト形式で返すHTTPサーバを別スレッドで起動する
+
+    認証は無いので, 既定ではローカルホストでだけ待ち受ける (他のマシンから見るときは host="0.0.0.0").
+
+    routes ({パス: 関数}) を渡すと, そのパスへのGETでクエリ引数の dict を関数に渡し,
+    返り値の文字列を返す. 関数が ValueError を投げたら 400, RuntimeError なら 409 を返す.
+    """
+    routes = routes or {}
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/metrics":
+                self.reply(metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+            elif url.path in routes:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    body = routes[url.path](params)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                except RuntimeError as e:
+                    self.send_error(409, str(e))
+                    return
+                self.reply(body, "text/plain; charset=utf-8")
+            else:
+                self.send_error(404)
+
+        def reply(self, text, content_type):
+            body = text.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # スクレイプごとのアクセスログは出さない
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
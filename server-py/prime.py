@@ -0,0 +1,11 @@
+def is_prime(number):
+    """素数判定アルゴリズム (試し割り)
+
+    client-py/simulate.py がこの関数の処理時間を測ってシミュレーションのモデルを作る
+    """
+    if number > 1:
+        for i in range(2, int(number**0.5) + 1):
+            if (number % i) == 0:
+                return False
+        return True
+    return False
@@ -0,0 +1,310 @@
+"""稼働中のサーバを止めずにプロファイルを取る
+
+2種類のプロファイラを用意している.
+
+- サンプリング: 別スレッドから sys._current_frames() を一定間隔で読み, ワーカースレッドの
+  スタックを数える. 処理を邪魔しないので負荷をかけたままでも使える.
+  出力は collapsed stack 形式 (flamegraph.pl や speedscope にそのまま渡せる) と上位N関数の表.
+- RPCごとの cProfile: 指定した割合のRPCだけを cProfile で計測して合算する.
+  関数ごとの呼び出し回数と時間が正確に取れるが, 計測したRPCは遅くなる.
+  Python 3.12 以降は cProfile が全スレッドを計測してしまうので使えない (サンプリングを使う).
+
+どちらも SIGUSR1 / SIGUSR2 (1回目で開始, 2回目で停止してファイルに書き出す) か,
+メトリクス用HTTPポートの /debug/profile, /debug/rpc-profile から開始できる.
+Windows にはこれらのシグナルが無いので, HTTPからだけ使える.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.01  # サンプリング間隔 (秒)
+DEFAULT_RPC_FRACTION = 0.05  # cProfile で計測するRPCの割合
+DEFAULT_TOP = 20
+MAX_SECONDS = 300  # HTTPから指定できる計測時間の上限
+SIGNALS_AVAILABLE = hasattr(signal, "SIGUSR1")  # Windows には SIGUSR1/SIGUSR2 が無い
+# 3.12 以降の cProfile は sys.monitoring (インタプリタ全体) を使い, 1つのRPCだけを計測できない
+RPC_PROFILING_AVAILABLE = sys.version_info < (3, 12)
+
+
+_labels = {}  # コードオブジェクト -> "ファイル名:関数名"
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return label
+
+
+def _is_idle(frame):
+    """スレッドプールのワーカーが次の仕事を待っているだけのスタックか"""
+    code = frame.f_code
+    return code.co_name == "_worker" and code.co_filename.endswith(os.path.join("futures", "thread.py"))
+
+
+class SampleReport:
+    """サンプリング結果. stacks は collapsed stack (根;...;葉) ごとのサンプル数"""
+
+    def __init__(self, stacks, idle, threads, interval, elapsed):
+        self.stacks = stacks
+        self.idle = idle
+        self.threads = threads
+        self.interval = interval
+        self.elapsed = elapsed
+
+    def collapsed(self):
+        """flamegraph.pl / speedscope が読める "根;...;葉 回数" 形式"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=DEFAULT_TOP):
+        """自分自身 (self) と呼び出し先を含めた (total) サンプル数の多い関数の表"""
+        busy = sum(self.stacks.values())
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        samples = busy + self.idle
+        lines = [f"{samples} samples from {self.threads} worker thread(s) over {self.elapsed:.1f}s "
+                 f"(interval {self.interval * 1000:g}ms), busy {busy / samples * 100 if samples else 0:.1f}%",
+                 f"{'self%':>7} {'total%':>7}  function"]
+        for frame, count in own.most_common(limit):
+            lines.append(f"{count / busy * 100:7.1f} {total[frame] / busy * 100:7.1f}  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """名前が thread_prefix で始まるスレッドのスタックを interval 秒ごとに記録する"""
+
+    def __init__(self, thread_prefix, interval=DEFAULT_INTERVAL):
+        self.thread_prefix = thread_prefix
+        self.interval = interval
+        self._stacks = Counter()
+        self._idle = 0
+        self._threads = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return SampleReport(self._stacks, self._idle, len(self._threads), self.interval,
+                            time.perf_counter() - self._start)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            workers = {thread.ident for thread in threading.enumerate() if thread.name.startswith(self.thread_prefix)}
+            for ident, frame in sys._current_frames().items():
+                if ident not in workers:
+                    continue
+                self._threads.add(ident)
+                if _is_idle(frame):
+                    self._idle += 1
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(labels))] += 1
+
+
+class RpcProfiler:
+    """fraction の割合のRPCを cProfile で計測して合算する (Python 3.11 まで)
+
+    3.11 までの cProfile は有効にしたスレッドだけを計測するので, 1つのRPCの処理だけが記録され,
+    遅くなるのもそのRPCだけで済む. 計測中のRPCがあるときに来たRPCは計測しない
+    (同時に計測するRPCを1つにして, オーバーヘッドを抑える).
+    3.12 以降は cProfile が sys.monitoring を使い, 有効にしている間は全てのスレッドが計測され
+    遅くなるため, Profiler.start_rpc が開始を断る.
+    """
+
+    def __init__(self):
+        self.fraction = 0.0
+        self.profiled = 0
+        self._stats = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def start(self, fraction):
+        with self._lock:
+            self._stats = None
+            self.profiled = 0
+        self.fraction = fraction
+
+    def stop(self):
+        """計測を止めて (pstats.Stats または None, 計測したRPC数) を返す"""
+        self.fraction = 0.0
+        with self._lock:
+            stats, self._stats = self._stats, None
+            return stats, self.profiled
+
+    def call(self, behavior, request, context):
+        if self.fraction <= 0.0 or random.random() >= self.fraction or not self._busy.acquire(blocking=False):
+            return behavior(request, context)
+        try:
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(behavior, request, context)
+            finally:
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+                    self.profiled += 1
+        finally:
+            self._busy.release()
+
+
+def format_stats(stats, profiled, limit=DEFAULT_TOP):
+    """RpcProfiler の結果を累積時間の多い順に limit 件の表にする"""
+    if stats is None:
+        return "No RPCs were profiled\n"
+    stream = io.StringIO()
+    stream.write(f"{profiled} RPC(s) profiled\n")
+    stats.stream = stream
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+class Profiler:
+    """シグナルとHTTPからサンプリング/cProfile を開始・停止する"""
+
+    def __init__(self, thread_prefix, out_dir="profiles", interval=DEFAULT_INTERVAL, rpc_fraction=DEFAULT_RPC_FRACTION):
+        self.thread_prefix = thread_prefix
+        self.out_dir = out_dir
+        self.interval = interval
+        self.rpc_fraction = rpc_fraction
+        self.rpc = RpcProfiler()
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def call(self, behavior, request, context):
+        return self.rpc.call(behavior, request, context)
+
+    def start_sampling(self, interval=None):
+        with self._lock:
+            if self._sampler is not None:
+                raise RuntimeError("the sampling profiler is already running")
+            self._sampler = SamplingProfiler(self.thread_prefix, interval or self.interval)
+            self._sampler.start()
+
+    def stop_sampling(self):
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            raise RuntimeError("the sampling profiler is not running")
+        return sampler.stop()
+
+    def sample_for(self, seconds, interval=None):
+        self.start_sampling(interval)
+        time.sleep(seconds)
+        return self.stop_sampling()
+
+    def start_rpc(self, fraction=None):
+        if not RPC_PROFILING_AVAILABLE:
+            raise RuntimeError("per-RPC cProfile is not available on Python 3.12+ (cProfile there traces every thread); "
+                               "use the sampling profiler (SIGUSR1 or /debug/profile) instead")
+        with self._lock:
+            if self.rpc.fraction > 0.0:
+                raise RuntimeError("RPC profiling is already running")
+            self.rpc.start(fraction or self.rpc_fraction)
+
+    def stop_rpc(self):
+        with self._lock:
+            if self.rpc.fraction <= 0.0:
+                raise RuntimeError("RPC profiling is not running")
+            return self.rpc.stop()
+
+    def rpc_for(self, seconds, fraction=None):
+        self.start_rpc(fraction)
+        time.sleep(seconds)
+        return self.stop_rpc()
+
+    def _path(self, kind, suffix):
+        os.makedirs(self.out_dir, exist_ok=True)
+        return os.path.join(self.out_dir, f"{kind}_{os.getpid()}_{time.strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+    def toggle_sampling(self, signum=None, frame=None):
+        """SIGUSR1: サンプリングを開始, もう一度送ると停止して .collapsed と .txt を書き出す"""
+        if self._sampler is None:
+            self.start_sampling()
+            print(f"Sampling profiler started (interval {self.interval * 1000:g}ms)")
+            return
+        report = self.stop_sampling()
+        collapsed = self._path("sample", ".collapsed")
+        with open(collapsed, "w") as f:
+            f.write(report.collapsed())
+        with open(os.path.splitext(collapsed)[0] + ".txt", "w") as f:
+            f.write(report.top())
+        print(f"Sampling profile written to {collapsed}")
+
+    def toggle_rpc(self, signum=None, frame=None):
+        """SIGUSR2: RPCごとの cProfile を開始, もう一度送ると停止して .prof と .txt を書き出す"""
+        if self.rpc.fraction <= 0.0:
+            try:
+                self.start_rpc()
+            except RuntimeError as e:
+                print(e)  # シグナルハンドラから例外を投げるとサーバが止まる
+                return
+            print(f"RPC profiling started ({self.rpc.fraction * 100:g}% of calls)")
+            return
+        stats, profiled = self.stop_rpc()
+        path = self._path("rpc", ".prof")
+        if stats is not None:
+            stats.dump_stats(path)  # python -m pstats や snakeviz で開ける
+        with open(os.path.splitext(path)[0] + ".txt", "w") as f:
+            f.write(format_stats(stats, profiled))
+        print(f"RPC profile ({profiled} calls) written to {os.path.splitext(path)[0]}.*")
+
+    def install_signal_handlers(self):
+        """SIGUSR1/SIGUSR2 で切り替えられるようにする. それらが無い (Windows) ときは False を返す"""
+        if not SIGNALS_AVAILABLE:
+            return False
+        signal.signal(signal.SIGUSR1, self.toggle_sampling)
+        signal.signal(signal.SIGUSR2, self.toggle_rpc)
+        return True
+
+    def routes(self):
+        """start_metrics_server に渡すHTTPハンドラ (クエリ引数の dict を受け取り本文を返す)"""
+
+        def seconds_param(params):
+            seconds = float(params.get("seconds", 10))
+            if not 0 < seconds <= MAX_SECONDS:
+                raise ValueError(f"seconds must be in (0, {MAX_SECONDS}]")
+            return seconds
+
+        def profile(params):
+            # /debug/profile?seconds=10&interval=0.01&format=collapsed|top&top=20
+            interval = float(params["interval"]) if "interval" in params else None
+            if interval is not None and interval <= 0:
+                raise ValueError("interval must be positive")
+            report = self.sample_for(seconds_param(params), interval)
+            if params.get("format", "collapsed") == "top":
+                return report.top(int(params.get("top", DEFAULT_TOP)))
+            return report.collapsed()
+
+        def rpc_profile(params):
+            # /debug/rpc-profile?seconds=10&fraction=0.05&top=20
+            fraction = float(params["fraction"]) if "fraction" in params else None
+            if fraction is not None and not 0 < fraction <= 1:
+                raise ValueError("fraction must be in (0, 1]")
+            stats, profiled = self.rpc_for(seconds_param(params), fraction)
+            return format_stats(stats, profiled, int(params.get("top", DEFAULT_TOP)))
+
+        return {"/debug/profile": profile, "/debug/rpc-profile": rpc_profile}
@@ -1,32 +1,141 @@
-from concurrent import futures
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import time
 import grpc
 import isPrime.isPrime_pb2 as isPrime_pb2
 import isPrime.isPrime_pb2_grpc as isPrime_pb2_grpc
+from metrics import WORKER_THREAD_PREFIX, InstrumentedThreadPoolExecutor, ServerMetrics, start_metrics_server
+from prime import is_prime
+from profiling import DEFAULT_RPC_FRACTION, SIGNALS_AVAILABLE, Profiler
+from timing import TimingInterceptor
+from tracefile import TraceWriter
+
+PORT = 9000
+MAX_WORKERS = 10
+
+
+def burn_cpu(seconds):
+    """GILを持ったまま, このスレッドのCPU時間で seconds 秒分ループする
+
+    time.sleep だとGILを手放すので, 他のスレッドが並行して処理できて遅くならない.
+    壁時計ではなくスレッドのCPU時間で測るので, 他のスレッドにGILを取られている間は数えない.
+    """
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
 
 
 class IsPrimeFuncServicer(isPrime_pb2_grpc.IsPrimeFuncServicer):
+    def __init__(self, slowdown=1.0):
+        # 遅いマシンを模擬するため, 判定に使ったCPU時間の slowdown 倍になるまでCPUを使い続ける
+        self.slowdown = slowdown
+
     def CheckPrime(self, request, context):
         number = request.Value
         print(number)
-        # 素数判定アルゴリズム
-        if number > 1:
-            for i in range(2, int(number**0.5) + 1):
-                if (number % i) == 0:
-                    return isPrime_pb2.IsPrimeResponse(IsPrime=False)
-            return isPrime_pb2.IsPrimeResponse(IsPrime=True)
-        return isPrime_pb2.IsPrimeResponse(IsPrime=False)
+        start = time.thread_time()
+        result = is_prime(number)
+        if self.slowdown > 1.0:
+            burn_cpu((time.thread_time() - start) * (self.slowdown - 1.0))
+        return isPrime_pb2.IsPrimeResponse(IsPrime=result)
 
 
-def serve():
+def serve(port, max_workers, metrics_port, slowdown=1.0, capture=None, profile_dir="profiles", rpc_fraction=DEFAULT_RPC_FRACTION,
+          metrics_host="127.0.0.1"):
+    metrics = ServerMetrics(max_workers)
+    trace = TraceWriter(capture) if capture else None  # 受け付けたリクエストを記録する
+    profiler = Profiler(WORKER_THREAD_PREFIX, profile_dir, rpc_fraction=rpc_fraction)  # 普段は何もしない
     server = grpc.server(
-        futures.ThreadPoolExecutor(max_workers=10)  # 最大10スレッドで動作
+        InstrumentedThreadPoolExecutor(metrics, max_workers=max_workers),  # 既定では最大10スレッドで動作
+        interceptors=[TimingInterceptor(metrics, trace, profiler)],  # 待ち時間と処理時間をトレーリングメタデータで返す
+        options=[("grpc.so_reuseport", 1)],  # 複数プロセスで同じポートを共有する
     )
-    isPrime_pb2_grpc.add_IsPrimeFuncServicer_to_server(IsPrimeFuncServicer(), server)
-    server.add_insecure_port("[::]:9000")  # 暗号化してない
+    if metrics_port:
+        start_metrics_server(metrics, metrics_port, profiler.routes(), metrics_host)  # http://<host>:<port>/metrics, /debug/profile
+        print(f"Metrics: http://{metrics_host}:{metrics_port}/metrics")
+    isPrime_pb2_grpc.add_IsPrimeFuncServicer_to_server(IsPrimeFuncServicer(slowdown), server)
+    server.add_insecure_port(f"[::]:{port}")  # 暗号化してない
     server.start()
-    server.wait_for_termination()
+    # terminate されたときもトレースを書き切ってから終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # SIGUSR1: サンプリング, SIGUSR2: RPCごとの cProfile (Windows では /debug/* だけ)
+    if not profiler.install_signal_handlers() and not metrics_port:
+        print("Profiling signals are not available on this platform; use --metrics-port for /debug/profile")
+    try:
+        server.wait_for_termination()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop(0)
+        if trace is not None:
+            trace.close()
+
+
+def serve_processes(processes, port, max_workers, metrics_port, slowdown=1.0, capture=None, profile_dir="profiles",
+                    rpc_fraction=DEFAULT_RPC_FRACTION, metrics_host="127.0.0.1"):
+    """GILを避けるため, 同じポートで待ち受けるサーバプロセスを processes 個起動する
+
+    接続はカーネル (SO_REUSEPORT) が各プロセスに振り分ける. メトリクスは
+    プロセスごとに metrics_port, metrics_port + 1, ... で公開し, トレースは
+    <capture>.0, <capture>.1, ... に記録する. SIGUSR1/SIGUSR2 は (使えるなら) 全ての子プロセスに転送する.
+    """
+    workers = []
+    for index in range(processes):
+        worker_metrics_port = metrics_port + index if metrics_port else 0
+        worker_capture = f"{capture}.{index}" if capture else None
+        worker = multiprocessing.Process(target=serve, args=(port, max_workers, worker_metrics_port, slowdown, worker_capture,
+                                                             profile_dir, rpc_fraction, metrics_host))
+        worker.start()
+        workers.append(worker)
+    # 親プロセスが terminate されたときも子プロセスを止める
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    def forward(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signum)
+
+    if SIGNALS_AVAILABLE:
+        signal.signal(signal.SIGUSR1, forward)
+        signal.signal(signal.SIGUSR2, forward)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python gRPC Prime judgement server.")
+    parser.add_argument('--port', type=int, default=PORT, help="Port for the gRPC service.")
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS, help="Number of worker threads (per process).")
+    parser.add_argument('--processes', type=int, default=1, help="Number of server processes sharing the port.")
+    parser.add_argument('--metrics-port', type=int, default=0, help="Port for the Prometheus /metrics and /debug/* endpoints (default: disabled; 9180 is suggested).")
+    parser.add_argument('--metrics-host', type=str, default="127.0.0.1", help="Address the metrics endpoint binds to (0.0.0.0 to expose it; it has no authentication).")
+    parser.add_argument('--cpus', type=str, help="Comma-separated CPU ids to pin the process to (Linux only).")
+    parser.add_argument('--slowdown', type=float, default=1.0, help="Stretch each CheckPrime to this multiple of its real compute time.")
+    parser.add_argument('--capture', type=str, help="Record every request to this binary trace file (for client-py/replay.py).")
+    parser.add_argument('--profile-dir', type=str, default="profiles", help="Where SIGUSR1/SIGUSR2 profiles are written.")
+    parser.add_argument('--profile-rpc-fraction', type=float, default=DEFAULT_RPC_FRACTION, help="Fraction of RPCs profiled with cProfile after SIGUSR2.")
+    args = parser.parse_args()
+
+    if args.cpus:
+        cpus = {int(cpu) for cpu in args.cpus.split(',')} & os.sched_getaffinity(0)
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        else:
+            print(f"CPUs {args.cpus} are not available on this machine; running without affinity")
+
     print("Python gRPC Prime judgement server!")
-    serve()
+    if args.processes > 1:
+        serve_processes(args.processes, args.port, args.max_workers, args.metrics_port, args.slowdown, args.capture,
+                        args.profile_dir, args.profile_rpc_fraction, args.metrics_host)
+    else:
+        serve(args.port, args.max_workers, args.metrics_port, args.slowdown, args.capture, args.profile_dir, args.profile_rpc_fraction,
+              args.metrics_host)
@@ -0,0 +1,67 @@
+import time
+import grpc
+from tracefile import peer_host
+
+# トレーリングメタデータのキー (値はすべて文字列)
+ARRIVAL_KEY = "x-server-arrival-ns"  # リクエスト到着時刻 (UNIX時刻, ナノ秒)
+START_KEY = "x-server-start-ns"  # ワーカースレッドで処理を開始した時刻 (UNIX時刻, ナノ秒)
+QUEUE_KEY = "x-server-queue-us"  # スレッドプールの待ち時間 (マイクロ秒)
+COMPUTE_KEY = "x-server-compute-us"  # 素数判定の処理時間 (マイクロ秒)
+
+
+class TimingInterceptor(grpc.ServerInterceptor):
+    """サーバ側の到着時刻・処理開始時刻・処理時間を計測してトレーリングメタデータで返す
+
+    intercept_service はgRPCの受信スレッドでスレッドプールへ投入される前に呼ばれるため,
+    ここで記録した時刻を到着時刻として扱う
+
+    metrics (ServerMetrics) を渡すと, 計測結果を1リクエストごとに集計する.
+    trace (TraceWriter) を渡すと, 値・到着時刻・送信元・処理時間をトレースファイルに記録する.
+    profiler (profiling.Profiler) を渡すと, RPCごとの cProfile が有効な間は一部の呼び出しを計測する.
+    """
+
+    def __init__(self, metrics=None, trace=None, profiler=None):
+        self._metrics = metrics
+        self._trace = trace
+        self._profiler = profiler
+
+    def intercept_service(self, continuation, handler_call_details):
+        arrival_ns = time.time_ns()
+        arrival = time.perf_counter_ns()
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+
+        behavior = handler.unary_unary
+
+        def timed_behavior(request, context):
+            start_ns = time.time_ns()
+            start = time.perf_counter_ns()
+            ok = False
+            response = None
+            try:
+                if self._profiler is not None:
+                    response = self._profiler.call(behavior, request, context)
+                else:
+                    response = behavior(request, context)
+                ok = True
+                return response
+            finally:
+                end = time.perf_counter_ns()
+                if self._metrics is not None:
+                    self._metrics.rpc_finished((start - arrival) / 1e9, (end - start) / 1e9, ok)
+                if self._trace is not None:
+                    self._trace.write(arrival, request.Value, peer_host(context.peer()), (end - arrival) // 1000,
+                                      ok and response.IsPrime, error=not ok)
+                context.set_trailing_metadata((
+                    (ARRIVAL_KEY, str(arrival_ns)),
+                    (START_KEY, str(start_ns)),
+                    (QUEUE_KEY, str((start - arrival) // 1000)),
+                    (COMPUTE_KEY, str((end - start) // 1000)),
+                ))
+
+        return grpc.unary_unary_rpc_method_handler(
+            timed_behavior,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
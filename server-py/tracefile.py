@@ -0,0 +1,160 @@
+"""リクエストトレースの読み書き
+
+client-py (workloads.py, replay.py) もこのファイルを読み込んで使う.
+
+形式 (リトルエンディアン):
+  ヘッダ     : b"LBTRACE1" + 記録開始時刻 (UNIX時刻, double)
+  送信元定義 : b"P" + 送信元ID (uint16) + 長さ (uint16) + 送信元 (UTF-8)
+  リクエスト : b"R" + 到着時刻 (記録開始からのナノ秒, uint64) + 値 (int64)
+               + 送信元ID (uint16) + 処理時間 (マイクロ秒, uint32) + フラグ (uint8)
+1リクエストあたり24バイト.
+
+python tracefile.py で記録を到着順に並べ直す処理を確認できる.
+"""
+import heapq
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+MAGIC = b"LBTRACE1"
+HEADER = struct.Struct("<8sd")
+PEER = struct.Struct("<HH")
+REQUEST = struct.Struct("<QqHIB")
+FLAG_IS_PRIME = 1
+FLAG_ERROR = 2
+REORDER_SLACK = 0.1  # 書き込み順と終了時刻の順のずれ (スレッドがロックを取る順番) の余裕 (秒)
+
+TraceRecord = namedtuple("TraceRecord", ["time", "offset", "value", "source", "latency", "is_prime", "error"])
+
+
+def peer_host(peer):
+    """context.peer() ("ipv4:10.0.0.2:53211" など) からポートを除いた送信元を返す"""
+    kind, _, address = peer.partition(":")
+    if kind in ("ipv4", "ipv6"):
+        address = address.rsplit(":", 1)[0]
+        return address.strip("[]").replace("%5B", "").replace("%5D", "")
+    return peer
+
+
+class TraceWriter:
+    """リクエストを1件ずつトレースファイルに追記する (複数スレッドから呼んでよい)"""
+
+    def __init__(self, path):
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._lock = threading.Lock()
+        self._peers = {}
+        self.start_ns = time.perf_counter_ns()
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+        self._file.flush()  # 異常終了しても空のファイルにならないよう, ヘッダはすぐに書き出す
+
+    def write(self, arrival_ns, value, peer, latency_us, is_prime, error=False):
+        """arrival_ns は time.perf_counter_ns() で取った到着時刻"""
+        flags = (FLAG_IS_PRIME if is_prime else 0) | (FLAG_ERROR if error else 0)
+        with self._lock:
+            if self._file.closed:
+                return
+            peer_id = self._peers.get(peer)
+            if peer_id is None:
+                peer_id = self._peers[peer] = len(self._peers) % 65536
+                encoded = peer.encode()[:65535]
+                self._file.write(b"P" + PEER.pack(peer_id, len(encoded)) + encoded)
+            offset = max(arrival_ns - self.start_ns, 0)
+            self._file.write(b"R" + REQUEST.pack(offset, value, peer_id, min(latency_us, 2**32 - 1), flags))
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def is_trace_file(path):
+    """トレースファイルか (ヘッダの途中で切れた, または空のファイルもトレースとして扱う)"""
+    with open(path, "rb") as f:
+        data = f.read(len(MAGIC))
+    return MAGIC.startswith(data)
+
+
+def read_trace(path):
+    """トレースファイルの記録を1件ずつ返す. time は到着時刻 (UNIX時刻)
+
+    記録は処理が終わった順に並んでいる. 到着順に欲しいときは read_trace_by_arrival を使う.
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"'{path}' has no trace header (empty or truncated file; did the server exit uncleanly?)")
+        magic, start_time = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a request trace")
+        peers = {}
+        while True:
+            kind = f.read(1)
+            if not kind:
+                break
+            if kind == b"P":
+                data = f.read(PEER.size)
+                if len(data) < PEER.size:
+                    break  # 書き込み途中で終了したファイル
+                peer_id, length = PEER.unpack(data)
+                peers[peer_id] = f.read(length).decode(errors="replace")
+            elif kind == b"R":
+                data = f.read(REQUEST.size)
+                if len(data) < REQUEST.size:
+                    break  # 書き込み途中で終了したファイル
+                offset_ns, value, peer_id, latency_us, flags = REQUEST.unpack(data)
+                yield TraceRecord(start_time + offset_ns / 1e9, offset_ns / 1e9, value, peers.get(peer_id, ""),
+                                  latency_us / 1e6, bool(flags & FLAG_IS_PRIME), bool(flags & FLAG_ERROR))
+            else:
+                raise ValueError(f"corrupt trace '{path}' (unknown record type {kind!r})")
+
+
+def max_latency(path):
+    """トレースファイル中で最長の処理時間 (秒). 記録を1件ずつ読むのでメモリは使わない"""
+    return max((record.latency for record in read_trace(path)), default=0.0)
+
+
+def read_trace_by_arrival(path):
+    """read_trace と同じ記録を到着時刻順に返す
+
+    記録は処理が終わった順 (到着時刻 + 処理時間の順) に並んでいる. 最初にファイル全体を読んで
+    最長の処理時間 W を求めておくと, 後から読む記録の到着時刻は「いま読んだ記録の終了時刻 - W」
+    より前にはならない. それより前に到着した記録から順に返すので, 手元に置くのは W 秒の間に
+    届いたリクエストの分だけで済む (ファイルは2回読む).
+    """
+    window = max_latency(path) + REORDER_SLACK
+    pending = []
+    for index, record in enumerate(read_trace(path)):
+        # UNIX時刻の time より桁の小さい offset で比べる (丸め誤差で順序が入れ替わらないように)
+        heapq.heappush(pending, (record.offset, index, record))
+        horizon = record.offset + record.latency - window
+        while pending and pending[0][0] < horizon:
+            yield heapq.heappop(pending)[2]
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+
+def _check_reordering():
+    """read_trace_by_arrival の確認: 速いリクエストに追い越された遅いリクエストも到着順に戻るか"""
+    # (到着時刻, 処理時間) 秒. 0.5秒に来た5秒かかるリクエストが後の5件に追い越される
+    requests = [(1.0, 0.001), (2.0, 0.001), (3.0, 0.001), (4.0, 0.001), (5.0, 0.001), (0.5, 5.0)]
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    try:
+        writer = TraceWriter(path)
+        for value, (arrival, latency) in sorted(enumerate(requests), key=lambda item: sum(item[1])):
+            writer.write(writer.start_ns + int(arrival * 1e9), value, "check", int(latency * 1e6), False)
+        writer.close()
+        offsets = [record.offset for record in read_trace_by_arrival(path)]
+    finally:
+        os.remove(path)
+    expected = sorted(arrival for arrival, _ in requests)
+    if offsets != expected:
+        raise AssertionError(f"records are not in arrival order: {offsets} (expected {expected})")
+    print("read_trace_by_arrival: ok")
+
+
+if __name__ == "__main__":
+    _check_reordering()